@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Archival of finished events.
+Moves events whose end_time is older than the retention period, together with
+their attendees, from the hot tables into events_archive/attendees_archive in
+small batches so each transaction only holds row locks briefly.
+
+Run once from the command line:
+
+    python archive.py --retention-days 365 --batch-size 500
+
+or in-process by setting ARCHIVE_INTERVAL_SECONDS (see main.py).
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from config import ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_SECONDS, ARCHIVE_RETENTION_DAYS
+from database import db
+from sold_out import sold_out_events
+
+logger = logging.getLogger(__name__)
+
+# Give up on a batch rather than queue behind long-running transactions
+LOCK_TIMEOUT = "2s"
+
+def archive_batch(cutoff: datetime, batch_size: int) -> Tuple[int, int]:
+    """
+    Move one batch of events that ended before `cutoff` into the archive tables.
+
+    Events locked by in-flight requests are skipped and picked up by a later batch.
+
+    Returns:
+        Tuple of (events archived, attendees archived)
+    """
+    with db.get_cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %(lock_timeout)s, true)", {'lock_timeout': LOCK_TIMEOUT})
+
+        cursor.execute("""
+            SELECT id FROM events
+            WHERE end_time < %(cutoff)s
+            ORDER BY end_time
+            LIMIT %(batch_size)s
+            FOR UPDATE SKIP LOCKED
+        """, {'cutoff': cutoff, 'batch_size': batch_size})
+
+        event_ids = [row['id'] for row in cursor.fetchall()]
+        if not event_ids:
+            return 0, 0
+
+        cursor.execute("""
+            INSERT INTO events_archive (id, name, location, start_time, end_time, max_capacity, timezone)
+            SELECT id, name, location, start_time, end_time, max_capacity, timezone FROM events
+            WHERE id = ANY(%(event_ids)s)
+        """, {'event_ids': event_ids})
+        events_archived = cursor.rowcount
+
+        cursor.execute("""
+            INSERT INTO attendees_archive (id, name, email, event_id)
+            SELECT id, name, email, event_id FROM attendees
+            WHERE event_id = ANY(%(event_ids)s)
+        """, {'event_ids': event_ids})
+        attendees_archived = cursor.rowcount
+
+        # Removes the events' attendees through ON DELETE CASCADE
+        cursor.execute("DELETE FROM events WHERE id = ANY(%(event_ids)s)", {'event_ids': event_ids})
+
+    sold_out_events.discard(event_ids)
+    return events_archived, attendees_archived
+
+def run_archive(
+    retention_days: int = ARCHIVE_RETENTION_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    pause: float = 0.1
+) -> Tuple[int, int]:
+    """
+    Archive every event that ended more than `retention_days` ago.
+
+    Args:
+        retention_days: How long finished events stay in the hot tables
+        batch_size: Events moved per transaction
+        max_batches: Stop after this many batches (None for no limit)
+        pause: Seconds to wait between batches to leave room for other work
+
+    Returns:
+        Tuple of (events archived, attendees archived)
+    """
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=retention_days)
+    total_events = total_attendees = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        events_archived, attendees_archived = archive_batch(cutoff, batch_size)
+        if not events_archived:
+            break
+        total_events += events_archived
+        total_attendees += attendees_archived
+        batches += 1
+        time.sleep(pause)
+
+    logger.info(f"Archived {total_events} events and {total_attendees} attendees ended before {cutoff.isoformat()}")
+    return total_events, total_attendees
+
+async def archive_periodically(interval: float = ARCHIVE_INTERVAL_SECONDS) -> None:
+    """Run the archival job every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(run_archive)
+        except Exception as e:
+            logger.error(f"Archival run failed: {e}")
+        await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move finished events and their attendees into the archive tables")
+    parser.add_argument("--retention-days", type=int, default=ARCHIVE_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_archive(retention_days=args.retention_days, batch_size=args.batch_size, max_batches=args.max_batches)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark registrations for a sold-out event through the full request path.
+
+Sends POST /events/{event_id}/register for a full event through routing, the
+rate limiter, the idempotency store and crud.create_attendee, once with the
+sold-out fast path and once with it disabled, so every request runs the
+database checks. The app's tables are created in a scratch schema of an
+explicitly given database, which is dropped afterwards:
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost:5432/postgres python benchmarks/bench_sold_out.py --iterations 2000
+
+Environment:
+    BENCH_DATABASE_URL: Scratch database to run against (required; never point it at production)
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+SCHEMA = "bench_sold_out"
+
+def reset_schema(create: bool = True) -> None:
+    connection = psycopg2.connect(DATABASE_URL)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            if create:
+                cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        connection.commit()
+    finally:
+        connection.close()
+
+def create_full_event(client) -> int:
+    start_time = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=30)
+    response = client.post("/events", json={
+        "name": "Sold-out benchmark",
+        "location": "Benchmark",
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + timedelta(hours=2)).isoformat(),
+        "max_capacity": 1,
+        "timezone": "UTC"
+    })
+    response.raise_for_status()
+    event_id = response.json()["id"]
+
+    response = client.post(f"/events/{event_id}/register", json={"name": "First", "email": "first@example.com"})
+    response.raise_for_status()
+    return event_id
+
+def run(client, event_id: int, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        response = client.post(
+            f"/events/{event_id}/register",
+            json={"name": "Benchmark", "email": f"bench-{i}@example.com"},
+            headers={"Idempotency-Key": str(uuid.uuid4())}
+        )
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == "Event is at maximum capacity"
+    return time.perf_counter() - start
+
+def report(label: str, iterations: int, elapsed: float) -> None:
+    print(f"{label}: {iterations} rejects in {elapsed:.3f}s, "
+          f"{iterations / elapsed:,.0f} rejects/s, {elapsed / iterations * 1e3:.3f} ms/reject")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not DATABASE_URL:
+        parser.error("BENCH_DATABASE_URL must point at a scratch database")
+
+    # Keep the rate limiter in the request path without letting it throttle the run;
+    # settings are read on import, so the app is imported afterwards
+    os.environ["RATE_LIMIT_REGISTER"] = f"{2 * args.iterations + 10}/3600"
+    from fastapi.testclient import TestClient
+
+    from database import db
+    from main import app
+    from sold_out import sold_out_events
+
+    # The app logs every test client request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    reset_schema()
+    db.connection_params = {"dsn": DATABASE_URL, "options": f"-c search_path={SCHEMA}"}
+    try:
+        with TestClient(app) as client:
+            event_id = create_full_event(client)
+            sold_out_events.mark(event_id)
+            report("Fast path on ", args.iterations, run(client, event_id, args.iterations))
+
+            sold_out_events.enabled = False
+            report("Fast path off", args.iterations, run(client, event_id, args.iterations))
+    finally:
+        reset_schema(create=False)
+
+if __name__ == "__main__":
+    main()
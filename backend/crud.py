@@ -3,7 +3,9 @@ from models import Event, Attendee
 from schemas import EventCreate, AttendeeCreate
 from datetime import datetime
 from timezone_utils import convert_to_utc, validate_timezone
-from typing import Tuple, Optional, List
+from sold_out import sold_out_events, NOTIFY_CHANNEL
+from tracing import trace_span
+from typing import Tuple, Optional, List, Sequence, Dict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,29 +35,64 @@ async def create_event(event: EventCreate) -> Event:
         })
         
         result = cursor.fetchone()
-        return Event.from_dict(dict(result))
+        with trace_span("build_models", rows=1):
+            return Event.from_dict(dict(result))
+
+# Columns that list endpoints may project with `fields=`
+EVENT_FIELDS = ('id', 'name', 'location', 'start_time', 'end_time', 'max_capacity', 'timezone', 'attendee_count')
+ATTENDEE_FIELDS = ('id', 'name', 'email', 'event_id')
+
+def _check_fields(fields: Sequence[str], allowed: Sequence[str]) -> None:
+    """Reject field names outside `allowed`; they are interpolated into SQL"""
+    unknown = set(fields).difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
 
-async def get_events(skip: int = 0, limit: int = 100) -> List[Event]:
-    """Get all events with pagination"""
+def _event_columns(fields: Sequence[str]) -> str:
+    """Build the SELECT list for the requested event fields"""
+    _check_fields(fields, EVENT_FIELDS)
+    columns = []
+    for field in fields:
+        if field == 'attendee_count':
+            columns.append("(SELECT COUNT(*) FROM attendees a WHERE a.event_id = e.id) AS attendee_count")
+        else:
+            columns.append(f"e.{field}")
+    return ", ".join(columns)
+
+async def get_events(skip: int = 0, limit: int = 100, fields: Sequence[str] = EVENT_FIELDS) -> List[Event]:
+    """Get all events with pagination, selecting only the requested fields"""
+    columns = _event_columns(fields)
     with db.get_cursor() as cursor:
-        cursor.execute("""
-            SELECT e.*, 
-                   COALESCE(COUNT(a.id), 0) as attendee_count
+        cursor.execute(f"""
+            SELECT {columns}
             FROM events e
-            LEFT JOIN attendees a ON e.id = a.event_id
-            GROUP BY e.id, e.name, e.location, e.start_time, e.end_time, e.max_capacity, e.timezone
             ORDER BY e.start_time DESC
             OFFSET %(skip)s LIMIT %(limit)s
         """, {'skip': skip, 'limit': limit})
         
         results = cursor.fetchall()
         events = []
-        for row in results:
-            event_data = dict(row)
-            events.append(Event.from_dict(event_data))
+        with trace_span("build_models", rows=len(results)):
+            for row in results:
+                event_data = dict(row)
+                events.append(Event.from_dict(event_data))
         
         return events
 
+async def get_events_by_ids(event_ids: Sequence[int], with_counts: bool = False) -> Dict[int, Event]:
+    """Get several events in one query, keyed by ID (missing IDs are absent)"""
+    fields = EVENT_FIELDS if with_counts else tuple(f for f in EVENT_FIELDS if f != 'attendee_count')
+    with db.get_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {_event_columns(fields)}
+            FROM events e
+            WHERE e.id = ANY(%(event_ids)s)
+        """, {'event_ids': list(event_ids)})
+        
+        results = cursor.fetchall()
+        with trace_span("build_models", rows=len(results)):
+            return {row['id']: Event.from_dict(dict(row)) for row in results}
+
 async def get_event(event_id: int) -> Optional[Event]:
     """Get a specific event by ID"""
     with db.get_cursor() as cursor:
@@ -70,11 +107,16 @@ async def get_event(event_id: int) -> Optional[Event]:
         
         result = cursor.fetchone()
         if result:
-            return Event.from_dict(dict(result))
+            with trace_span("build_models", rows=1):
+                return Event.from_dict(dict(result))
         return None
 
 async def create_attendee(attendee: AttendeeCreate, event_id: int) -> Tuple[Optional[Attendee], Optional[str]]:
     """Create a new attendee for an event"""
+    # Refuse registrations for events already known to be full
+    if sold_out_events.is_sold_out(event_id):
+        return None, "Event is at maximum capacity"
+    
     # Check if event exists
     event = await get_event(event_id)
     if not event:
@@ -99,6 +141,7 @@ async def create_attendee(attendee: AttendeeCreate, event_id: int) -> Tuple[Opti
         
         current_attendees = cursor.fetchone()['count']
         if current_attendees >= event.max_capacity:
+            sold_out_events.mark(event_id)
             return None, "Event is at maximum capacity"
         
         # Create attendee
@@ -113,13 +156,27 @@ async def create_attendee(attendee: AttendeeCreate, event_id: int) -> Tuple[Opti
         })
         
         result = cursor.fetchone()
+        
+        # Tell every worker (delivered on commit) once this registration fills the event
+        event_filled = current_attendees + 1 >= event.max_capacity
+        if event_filled:
+            cursor.execute("SELECT pg_notify(%(channel)s, %(event_id)s)", {
+                'channel': NOTIFY_CHANNEL,
+                'event_id': str(event_id)
+            })
+    
+    if event_filled:
+        sold_out_events.mark(event_id)
+    
+    with trace_span("build_models", rows=1):
         return Attendee.from_dict(dict(result)), None
 
-async def get_attendees(event_id: int, skip: int = 0, limit: int = 100) -> List[Attendee]:
-    """Get attendees for an event with pagination"""
+async def get_attendees(event_id: int, skip: int = 0, limit: int = 100, fields: Sequence[str] = ATTENDEE_FIELDS) -> List[Attendee]:
+    """Get attendees for an event with pagination, selecting only the requested fields"""
+    _check_fields(fields, ATTENDEE_FIELDS)
     with db.get_cursor() as cursor:
-        cursor.execute("""
-            SELECT id, name, email, event_id
+        cursor.execute(f"""
+            SELECT {", ".join(fields)}
             FROM attendees 
             WHERE event_id = %(event_id)s
             ORDER BY id
@@ -128,8 +185,9 @@ async def get_attendees(event_id: int, skip: int = 0, limit: int = 100) -> List[
         
         results = cursor.fetchall()
         attendees = []
-        for row in results:
-            attendees.append(Attendee.from_dict(dict(row)))
+        with trace_span("build_models", rows=len(results)):
+            for row in results:
+                attendees.append(Attendee.from_dict(dict(row)))
         
         return attendees
 
@@ -142,4 +200,35 @@ async def get_attendees_count(event_id: int) -> int:
         """, {'event_id': event_id})
         
         result = cursor.fetchone()
-        return result['count']
\ No newline at end of file
+        return result['count']
+
+async def get_archived_event(event_id: int) -> Optional[Event]:
+    """Get an archived event by ID"""
+    with db.get_cursor() as cursor:
+        cursor.execute("""
+            SELECT e.id, e.name, e.location, e.start_time, e.end_time, e.max_capacity, e.timezone,
+                   (SELECT COUNT(*) FROM attendees_archive a WHERE a.event_id = e.id) AS attendee_count
+            FROM events_archive e
+            WHERE e.id = %(event_id)s
+        """, {'event_id': event_id})
+        
+        result = cursor.fetchone()
+        if result:
+            with trace_span("build_models", rows=1):
+                return Event.from_dict(dict(result))
+        return None
+
+async def get_archived_attendees(event_id: int, skip: int = 0, limit: int = 100) -> List[Attendee]:
+    """Get attendees of an archived event with pagination"""
+    with db.get_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, name, email, event_id
+            FROM attendees_archive
+            WHERE event_id = %(event_id)s
+            ORDER BY id
+            OFFSET %(skip)s LIMIT %(limit)s
+        """, {'event_id': event_id, 'skip': skip, 'limit': limit})
+        
+        results = cursor.fetchall()
+        with trace_span("build_models", rows=len(results)):
+            return [Attendee.from_dict(dict(row)) for row in results]
@@ -5,6 +5,7 @@ import os
 import logging
 from contextlib import contextmanager
 from typing import Generator, Dict, Any, List, Optional
+from tracing import trace_cursor, trace_span
 
 # Load environment variables from .env
 load_dotenv()
@@ -44,13 +45,15 @@ class DatabaseConnection:
         connection = None
         cursor = None
         try:
-            connection = self.get_connection()
+            with trace_span("db.connect"):
+                connection = self.get_connection()
             if dict_cursor:
-                cursor = connection.cursor(cursor_factory=RealDictCursor)
+                cursor = trace_cursor(connection.cursor(cursor_factory=RealDictCursor))
             else:
-                cursor = connection.cursor()
+                cursor = trace_cursor(connection.cursor())
             yield cursor
-            connection.commit()
+            with trace_span("db.commit"):
+                connection.commit()
         except Exception as e:
             if connection:
                 connection.rollback()
@@ -101,6 +104,47 @@ def create_tables():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_start_time ON events(start_time)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendees_event_id ON attendees(event_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendees_email ON attendees(email)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_end_time ON events(end_time)")
+        
+        # Archive tables for finished events moved out of the hot tables
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS events_archive (
+                id INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                location VARCHAR NOT NULL,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP NOT NULL,
+                max_capacity INTEGER NOT NULL,
+                timezone VARCHAR NOT NULL DEFAULT 'IST',
+                archived_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS attendees_archive (
+                id INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                email VARCHAR NOT NULL,
+                event_id INTEGER NOT NULL,
+                FOREIGN KEY (event_id) REFERENCES events_archive(id) ON DELETE CASCADE
+            )
+        """)
+        
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendees_archive_event_id ON attendees_archive(event_id)")
+        
+        # Stored responses for Idempotency-Key retries, shared by all workers
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key VARCHAR PRIMARY KEY,
+                fingerprint VARCHAR NOT NULL,
+                status_code INTEGER,
+                response JSONB,
+                claimed_at TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP NOT NULL
+            )
+        """)
+        
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at)")
 
 def test_connection():
     """Test database connection"""
@@ -0,0 +1,199 @@
+"""
+Idempotency key support for write endpoints.
+Stores the first response for each `Idempotency-Key` in the idempotency_keys
+table, shared by every worker, so client retries get the same answer without
+re-running validation and inserts.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Type
+
+from fastapi import HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from psycopg2.extras import Json
+from pydantic import BaseModel
+
+from config import IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_TTL_SECONDS
+from database import db
+
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+
+@dataclass
+class StoredResponse:
+    """Row recorded for an idempotency key; `status_code` is None while the first request runs."""
+    fingerprint: str
+    status_code: Optional[int]
+    content: Any
+
+class IdempotencyStore:
+    """Expiring responses keyed by method, path and idempotency key, claimed atomically in the database."""
+
+    def __init__(self, ttl: float = 86400, lock_timeout: float = 60, prune_every: int = 100, prune_batch: int = 1000):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.prune_every = prune_every
+        self.prune_batch = prune_batch
+        self._claims = 0
+
+    def claim(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Claim `key` for the current request.
+
+        Expired keys, and claims abandoned for longer than `lock_timeout`
+        (e.g. by a crashed worker), are taken over.
+
+        Returns:
+            None when this request owns the key, otherwise the stored row
+        """
+        self._claims += 1
+        if self._claims % self.prune_every == 0:
+            self.prune()
+
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO idempotency_keys (key, fingerprint, claimed_at, expires_at)
+                VALUES (%(key)s, %(fingerprint)s, NOW(), NOW() + %(ttl)s * INTERVAL '1 second')
+                ON CONFLICT (key) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint,
+                    status_code = NULL,
+                    response = NULL,
+                    claimed_at = EXCLUDED.claimed_at,
+                    expires_at = EXCLUDED.expires_at
+                WHERE idempotency_keys.expires_at <= NOW()
+                   OR (idempotency_keys.status_code IS NULL
+                       AND idempotency_keys.claimed_at <= NOW() - %(lock_timeout)s * INTERVAL '1 second')
+                RETURNING key
+            """, {'key': key, 'fingerprint': fingerprint, 'ttl': self.ttl, 'lock_timeout': self.lock_timeout})
+            if cursor.fetchone():
+                return None
+
+            cursor.execute("""
+                SELECT fingerprint, status_code, response FROM idempotency_keys
+                WHERE key = %(key)s
+            """, {'key': key})
+            row = cursor.fetchone()
+
+        if row is None:
+            # Released by its owner in the meantime
+            return self.claim(key, fingerprint)
+        return StoredResponse(row['fingerprint'], row['status_code'], row['response'])
+
+    def complete(self, key: str, status_code: int, content: Any) -> None:
+        """Record the response for a claimed key."""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE idempotency_keys SET status_code = %(status_code)s, response = %(response)s
+                WHERE key = %(key)s
+            """, {'key': key, 'status_code': status_code, 'response': Json(content)})
+
+    def release(self, key: str) -> None:
+        """Drop an unfinished claim so the request can be retried."""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM idempotency_keys
+                WHERE key = %(key)s AND status_code IS NULL
+            """, {'key': key})
+
+    def prune(self) -> int:
+        """Delete up to `prune_batch` expired keys; returns the number deleted."""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM idempotency_keys
+                WHERE key IN (
+                    SELECT key FROM idempotency_keys
+                    WHERE expires_at <= NOW()
+                    LIMIT %(batch)s
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, {'batch': self.prune_batch})
+            return cursor.rowcount
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+        response_model: Type[BaseModel],
+    ) -> Any:
+        """
+        Run `handler` once per key and replay its response for later duplicates.
+
+        Successful results and client errors (4xx) are stored; server errors are
+        not, so the request can be retried. Duplicates that arrive while the first
+        request is still running, on any worker, get 409 with Retry-After rather
+        than running again or holding a write slot while they wait.
+
+        Args:
+            key: Scoped idempotency key
+            fingerprint: Hash of the request payload, used to reject key reuse
+            handler: Coroutine function performing the actual work
+            response_model: Model used to serialise the handler's result
+
+        Returns:
+            The handler's result for the first request, a JSONResponse for replays
+        """
+        stored = self.claim(key, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Idempotency-Key was already used with a different request"
+                )
+            if stored.status_code is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed",
+                    headers={"Retry-After": "1"}
+                )
+            return JSONResponse(
+                status_code=stored.status_code,
+                content=stored.content,
+                headers={REPLAY_HEADER: "true"}
+            )
+
+        try:
+            result = await handler()
+        except HTTPException as e:
+            if e.status_code < 500:
+                self.complete(key, e.status_code, {"detail": e.detail})
+            else:
+                self.release(key)
+            raise
+        except BaseException:
+            self.release(key)
+            raise
+
+        self.complete(key, status.HTTP_200_OK, jsonable_encoder(response_model.model_validate(result)))
+        return result
+
+# Global idempotency store
+store = IdempotencyStore(ttl=IDEMPOTENCY_TTL_SECONDS, lock_timeout=IDEMPOTENCY_LOCK_SECONDS)
+
+async def run_idempotent(
+    request: Request,
+    idempotency_key: Optional[str],
+    payload: BaseModel,
+    handler: Callable[[], Awaitable[Any]],
+    response_model: Type[BaseModel],
+) -> Any:
+    """
+    Execute a write handler honouring an optional `Idempotency-Key` header.
+
+    Keys are scoped to the method and request path, not the client address, so
+    a retry from a different network still matches. They are bound to the
+    request payload so a reused key with a different body is rejected.
+    """
+    if idempotency_key is None:
+        return await handler()
+
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be between 1 and {MAX_KEY_LENGTH} characters"
+        )
+
+    key = f"{request.method}:{request.url.path}:{idempotency_key}"
+    fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    return await store.run(key, fingerprint, handler, response_model)
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, HTTPException, status, Query
+from fastapi import FastAPI, HTTPException, status, Query, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from database import create_tables, test_connection
-from schemas import EventCreate, EventResponse, AttendeeCreate, AttendeeResponse, EventWithAttendees, EventWithTimezone
-from crud import create_event, get_events, get_event, create_attendee, get_attendees, get_attendees_count
-from timezone_utils import convert_from_utc, format_datetime_with_timezone, get_timezone_info, get_supported_timezones
+from pydantic import BaseModel, TypeAdapter
+from models import Event
+from schemas import EventCreate, EventResponse, AttendeeCreate, AttendeeResponse, EventWithAttendees, EventWithTimezone, LocalizedEventResponse, EventListItem, AttendeeListItem, BatchEvent, BatchEventResult, LOCAL_TIME_FIELDS, parse_fields, project_model
+from crud import create_event, get_events, get_events_by_ids, get_event, create_attendee, get_attendees, get_attendees_count, get_archived_event, get_archived_attendees, EVENT_FIELDS, ATTENDEE_FIELDS
+from timezone_utils import convert_from_utc, format_datetimes_with_timezone, get_timezone_info, get_supported_timezones, validate_timezone
+from rate_limit import rate_limit
+from idempotency import run_idempotent
+from sold_out import sold_out_events
+from compression import CompressionMiddleware
+from archive import archive_periodically
+from tracing import TracedRoute, TracingMiddleware, get_recent_traces
+from config import (
+    SOLD_OUT_NOTIFICATIONS, COMPRESSION_MIN_SIZE, MAX_BATCH_EVENTS, ARCHIVE_INTERVAL_SECONDS,
+    TRACING_ENABLED, TRACE_BUFFER_SIZE, TRACE_DEBUG_TOKEN, FORWARDED_ALLOW_IPS
+)
 from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple, Type
+import asyncio
+import hmac
 import os
 import logging
 
 app = FastAPI(title="Event Management System", version="1.0.0")
 
+if TRACING_ENABLED:
+    # Must be set before routes are declared so every route is traced
+    app.router.route_class = TracedRoute
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +41,9 @@ async def startup_event():
         create_tables()
         logger.info("Database tables created successfully")
         
+        count = sold_out_events.seed()
+        logger.info(f"Loaded {count} sold-out events")
+        
         # Test database connection
         if test_connection():
             logger.info("Database connection test successful")
@@ -29,6 +52,26 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to create database tables: {e}")
         # Don't raise the exception to allow the app to start even if DB is unavailable
+    
+    # The listener reconnects and reseeds on its own, so start it even if the database is down now
+    if SOLD_OUT_NOTIFICATIONS:
+        sold_out_events.start_listener()
+    
+    # Each archival run handles its own database errors
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        app.state.archive_task = asyncio.create_task(archive_periodically(ARCHIVE_INTERVAL_SECONDS))
+        logger.info(f"Archiving events every {ARCHIVE_INTERVAL_SECONDS}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks"""
+    archive_task = getattr(app.state, "archive_task", None)
+    if archive_task is not None:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
 
 # Add CORS middleware
 app.add_middleware(
@@ -39,75 +82,224 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/events", response_model=EventResponse)
-async def create_new_event(event: EventCreate):
+# Compress large list responses for clients that accept gzip/brotli
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+@app.post("/events", response_model=EventResponse, dependencies=[Depends(rate_limit("create_event"))])
+async def create_new_event(
+    request: Request,
+    event: EventCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Key making retries of this request safe")
+):
     """Create a new event"""
-    if event.start_time >= event.end_time:
+    async def handler():
+        if event.start_time >= event.end_time:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="End time must be after start time"
+            )
+        
+        if event.max_capacity <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Max capacity must be greater than 0"
+            )
+        
+        try:
+            return await create_event(event=event)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    return await run_idempotent(request, idempotency_key, event, handler, EventResponse)
+
+def resolve_fields(value: Optional[str], allowed: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """Validate a `fields=` query parameter, raising 400 for unknown fields"""
+    try:
+        return parse_fields(value, allowed)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="End time must be after start time"
+            detail=str(e)
         )
+
+@lru_cache(maxsize=128)
+def projected_list_adapter(model: Type[BaseModel], fields: Tuple[str, ...]) -> TypeAdapter:
+    """Cached serializer for lists of a projected response model"""
+    return TypeAdapter(list[project_model(model, fields)])
+
+def projected_response(items: list, model: Type[BaseModel], fields: Tuple[str, ...]) -> Response:
+    """Serialize items with a response model narrowed to the requested fields"""
+    adapter = projected_list_adapter(model, fields)
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(items, from_attributes=True)),
+        media_type="application/json"
+    )
+
+async def get_event_or_archived(event_id: int) -> Tuple[Event, bool]:
+    """Find an event in the hot tables or, once finished and moved, the archive; returns (event, archived)"""
+    event = await get_event(event_id)
+    if event:
+        return event, False
     
-    if event.max_capacity <= 0:
+    event = await get_archived_event(event_id)
+    if not event:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Max capacity must be greater than 0"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
         )
-    
-    try:
-        return await create_event(event=event)
-    except ValueError as e:
+    return event, True
+
+def check_timezone(timezone: Optional[str]) -> None:
+    """Reject an unsupported `timezone=` query parameter with 400"""
+    if timezone is not None and not validate_timezone(timezone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
+            detail=f"Unsupported timezone: {timezone}"
         )
 
-@app.get("/events", response_model=list[EventResponse])
-async def list_events(skip: int = 0, limit: int = 100):
+def localize_event_times(events: Sequence[Event], timezone: str) -> List[Tuple[str, str]]:
+    """Format the start/end times of a page of events in one pass"""
+    formatted = format_datetimes_with_timezone(
+        [dt for event in events for dt in (event.start_time, event.end_time)],
+        timezone
+    )
+    return list(zip(formatted[0::2], formatted[1::2]))
+
+@app.get("/events", response_model=list[EventListItem], response_model_exclude_none=True)
+async def list_events(
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[str] = Query(None, description=f"Comma-separated fields to return ({', '.join(EVENT_FIELDS)})"),
+    timezone: Optional[str] = Query(None, description="Timezone to add local start/end times in")
+):
     """List all upcoming events"""
-    return await get_events(skip=skip, limit=limit)
+    selected = resolve_fields(fields, EVENT_FIELDS)
+    check_timezone(timezone)
+    
+    if timezone is None:
+        if selected is None:
+            return await get_events(skip=skip, limit=limit)
+        events = await get_events(skip=skip, limit=limit, fields=selected)
+        return projected_response(events, EventResponse, selected)
+    
+    # Local times need start/end times even when they are not returned
+    output_fields = selected or EVENT_FIELDS
+    query_fields = tuple(f for f in EVENT_FIELDS if f in output_fields or f in ('start_time', 'end_time'))
+    events = await get_events(skip=skip, limit=limit, fields=query_fields)
+    items = [
+        dict(event.to_dict(), start_time_local=start_local, end_time_local=end_local)
+        for event, (start_local, end_local) in zip(events, localize_event_times(events, timezone))
+    ]
+    return projected_response(items, LocalizedEventResponse, output_fields + LOCAL_TIME_FIELDS)
 
-@app.post("/events/{event_id}/register", response_model=AttendeeResponse)
-async def register_attendee(event_id: int, attendee: AttendeeCreate):
-    """Register an attendee for a specific event"""
-    attendee_result, error = await create_attendee(attendee=attendee, event_id=event_id)
+@app.get("/events/batch", response_model=list[BatchEventResult], response_model_exclude_none=True)
+async def get_events_batch(
+    ids: str = Query(..., description=f"Comma-separated event IDs (at most {MAX_BATCH_EVENTS})"),
+    counts: bool = Query(False, description="Include attendee counts"),
+    timezone: Optional[str] = Query(None, description="Timezone to add local start/end times in")
+):
+    """Get several events in one request, in the order their IDs were given"""
+    try:
+        event_ids = [int(event_id) for event_id in ids.split(",") if event_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers"
+        )
     
-    if error:
+    if not event_ids or len(event_ids) > MAX_BATCH_EVENTS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error
+            detail=f"Between 1 and {MAX_BATCH_EVENTS} event IDs must be requested"
         )
     
-    return attendee_result
+    check_timezone(timezone)
+    
+    events = await get_events_by_ids(list(dict.fromkeys(event_ids)), with_counts=counts)
+    
+    local_times = {}
+    if timezone is not None:
+        local_times = dict(zip(events, localize_event_times(list(events.values()), timezone)))
+    
+    results = []
+    for event_id in event_ids:
+        event = events.get(event_id)
+        if event is None:
+            results.append(BatchEventResult(id=event_id, found=False))
+            continue
+        
+        batch_event = BatchEvent(**event.to_dict())
+        if not counts:
+            batch_event.attendee_count = None
+        if event_id in local_times:
+            batch_event.start_time_local, batch_event.end_time_local = local_times[event_id]
+        results.append(BatchEventResult(id=event_id, found=True, event=batch_event))
+    
+    return results
 
-@app.get("/events/{event_id}/attendees", response_model=list[AttendeeResponse])
+@app.post("/events/{event_id}/register", response_model=AttendeeResponse, dependencies=[Depends(rate_limit("register"))])
+async def register_attendee(
+    request: Request,
+    event_id: int,
+    attendee: AttendeeCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Key making retries of this request safe")
+):
+    """Register an attendee for a specific event"""
+    async def handler():
+        attendee_result, error = await create_attendee(attendee=attendee, event_id=event_id)
+        
+        if error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=error
+            )
+        
+        return attendee_result
+    
+    return await run_idempotent(request, idempotency_key, attendee, handler, AttendeeResponse)
+
+@app.get("/events/{event_id}/attendees", response_model=list[AttendeeListItem], response_model_exclude_none=True)
 async def get_event_attendees(
     event_id: int, 
     skip: int = Query(0, ge=0, description="Number of attendees to skip"),
-    limit: int = Query(100, ge=1, le=1000, description="Maximum number of attendees to return")
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of attendees to return"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated fields to return ({', '.join(ATTENDEE_FIELDS)})")
 ):
     """Get attendees for a specific event with pagination"""
-    # Check if event exists
-    event = await get_event(event_id)
-    if not event:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event not found"
-        )
+    selected = resolve_fields(fields, ATTENDEE_FIELDS)
+    
+    _, archived = await get_event_or_archived(event_id)
+    if archived:
+        attendees = await get_archived_attendees(event_id=event_id, skip=skip, limit=limit)
+        return attendees if selected is None else projected_response(attendees, AttendeeResponse, selected)
     
-    return await get_attendees(event_id=event_id, skip=skip, limit=limit)
+    if selected is None:
+        return await get_attendees(event_id=event_id, skip=skip, limit=limit)
+    
+    attendees = await get_attendees(event_id=event_id, skip=skip, limit=limit, fields=selected)
+    return projected_response(attendees, AttendeeResponse, selected)
 
-@app.get("/events/{event_id}", response_model=EventWithAttendees)
-async def get_event_with_attendees(event_id: int):
+@app.get("/events/{event_id}", response_model=EventWithAttendees, response_model_exclude_none=True)
+async def get_event_with_attendees(
+    event_id: int,
+    timezone: Optional[str] = Query(None, description="Timezone to add local start/end times in")
+):
     """Get event details with all attendees"""
-    event = await get_event(event_id)
-    if not event:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event not found"
-        )
+    check_timezone(timezone)
     
-    attendees = await get_attendees(event_id=event_id)
+    event, archived = await get_event_or_archived(event_id)
+    if archived:
+        attendees = await get_archived_attendees(event_id=event_id)
+    else:
+        attendees = await get_attendees(event_id=event_id)
+    
+    start_time_local, end_time_local = localize_event_times([event], timezone)[0] if timezone else (None, None)
     return EventWithAttendees(
         id=event.id,
         name=event.name,
@@ -115,6 +307,8 @@ async def get_event_with_attendees(event_id: int):
         start_time=event.start_time,
         end_time=event.end_time,
         max_capacity=event.max_capacity,
+        start_time_local=start_time_local,
+        end_time_local=end_time_local,
         attendees=attendees
     )
 
@@ -126,15 +320,8 @@ def get_supported_timezones_list():
 @app.get("/events/{event_id}/attendees/count")
 async def get_event_attendees_count(event_id: int):
     """Get total count of attendees for a specific event"""
-    # Check if event exists
-    event = await get_event(event_id)
-    if not event:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event not found"
-        )
-    
-    count = await get_attendees_count(event_id=event_id)
+    event, archived = await get_event_or_archived(event_id)
+    count = event.attendee_count if archived else await get_attendees_count(event_id=event_id)
     return {"event_id": event_id, "total_attendees": count}
 
 @app.get("/events/{event_id}/timezone", response_model=EventWithTimezone)
@@ -143,12 +330,7 @@ async def get_event_with_timezone(
     timezone: str = Query("IST", description="Timezone to convert times to")
 ):
     """Get event details with times converted to specified timezone"""
-    event = await get_event(event_id)
-    if not event:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Event not found"
-        )
+    event, _ = await get_event_or_archived(event_id)
     
     # Get timezone info
     tz_info = get_timezone_info(timezone)
@@ -159,8 +341,7 @@ async def get_event_with_timezone(
         )
     
     # Convert times to the specified timezone
-    start_time_local = format_datetime_with_timezone(event.start_time, timezone)
-    end_time_local = format_datetime_with_timezone(event.end_time, timezone)
+    start_time_local, end_time_local = localize_event_times([event], timezone)[0]
     
     return EventWithTimezone(
         id=event.id,
@@ -176,6 +357,22 @@ async def get_event_with_timezone(
         timezone_display=tz_info.display_name
     )
 
+# Traces include SQL statements, so the endpoint only exists when a token protects it
+if TRACING_ENABLED and TRACE_DEBUG_TOKEN:
+    @app.get("/debug/traces")
+    async def get_debug_traces(
+        limit: int = Query(50, ge=1, le=TRACE_BUFFER_SIZE, description="Maximum number of traces to return"),
+        x_debug_token: str = Header("")
+    ):
+        """Get recent sampled and slow request traces, newest first"""
+        if not hmac.compare_digest(x_debug_token.encode(), TRACE_DEBUG_TOKEN.encode()):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Invalid debug token"
+            )
+        
+        return get_recent_traces(limit=limit)
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -302,4 +499,4 @@ async def health_check_db():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, proxy_headers=True, forwarded_allow_ips=FORWARDED_ALLOW_IPS)
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Admission control for write endpoints.
+Provides per-client token-bucket rate limiting and a global concurrency
+limiter so overload is rejected before any database work is done.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from config import (
+    RATE_LIMIT_API_KEYS,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_REDIS_COOLDOWN,
+    RATE_LIMIT_REDIS_TIMEOUT,
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMITS,
+    WRITE_CONCURRENCY_LIMIT,
+    WRITE_CONCURRENCY_RETRY_AFTER,
+)
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # redis is an optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket settings: `capacity` requests, refilled over `period` seconds."""
+    capacity: int
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> 'RateLimit':
+        """Parse a limit written as "<requests>/<seconds>" (e.g. "20/60")."""
+        try:
+            capacity, period = value.split("/", 1)
+            limit = cls(capacity=int(capacity), period=float(period))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit: {value!r}") from None
+        if limit.capacity <= 0 or limit.period <= 0:
+            raise ValueError(f"Invalid rate limit: {value!r}")
+        return limit
+
+class InMemoryBackend:
+    """Token buckets kept in process memory, evicting the least recently used clients."""
+
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """
+        Take one token from the bucket for `key`.
+
+        Returns:
+            (allowed, retry_after) where retry_after is the number of seconds
+            until a token becomes available when the request is rejected
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(limit.capacity), now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / limit.refill_rate
+
+class RedisBackend:
+    """Token buckets shared between workers through Redis."""
+
+    # Refill and take a token atomically; returns {allowed, tokens_left}
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str, fallback: InMemoryBackend, timeout: float = 0.1, cooldown: float = 30.0):
+        if redis is None:
+            raise RuntimeError("The redis package is required for RATE_LIMIT_REDIS_URL")
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._fallback = fallback
+        self._cooldown = cooldown
+        self._failing = False
+        self._retry_at = 0.0
+
+    async def acquire(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """
+        Take one token from the shared bucket.
+
+        After a Redis error the in-memory fallback is used for `cooldown`
+        seconds before Redis is tried again, so an unreachable server costs
+        at most one timeout per cooldown.
+        """
+        if time.monotonic() < self._retry_at:
+            return await self._fallback.acquire(key, limit)
+        try:
+            allowed, tokens = await self._script(
+                keys=[f"ratelimit:{key}"],
+                args=[limit.capacity, limit.refill_rate, time.time()],
+            )
+        except Exception as e:
+            if not self._failing:
+                logger.error(f"Redis rate limit backend failed, using in-memory buckets: {e}")
+                self._failing = True
+            self._retry_at = time.monotonic() + self._cooldown
+            return await self._fallback.acquire(key, limit)
+
+        if self._failing:
+            logger.info("Redis rate limit backend recovered")
+            self._failing = False
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / limit.refill_rate
+
+class ConcurrencyLimiter:
+    """Non-blocking counter that caps how many write requests run at once."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._active >= self.limit:
+                return False
+            self._active += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+
+def _create_backend():
+    """Use the shared Redis backend when configured, otherwise in-memory buckets."""
+    in_memory = InMemoryBackend(max_clients=RATE_LIMIT_MAX_CLIENTS)
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            return RedisBackend(
+                RATE_LIMIT_REDIS_URL,
+                fallback=in_memory,
+                timeout=RATE_LIMIT_REDIS_TIMEOUT,
+                cooldown=RATE_LIMIT_REDIS_COOLDOWN
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialise Redis rate limit backend, using in-memory: {e}")
+    return in_memory
+
+# Global limiter state
+backend = _create_backend()
+write_limiter = ConcurrencyLimiter(WRITE_CONCURRENCY_LIMIT)
+route_limits: Dict[str, RateLimit] = {route: RateLimit.parse(value) for route, value in RATE_LIMITS.items()}
+
+def get_client_key(request: Request) -> str:
+    """
+    Identify the caller for rate limiting.
+
+    Configured API keys get their own bucket; everyone else is keyed by the
+    client address. Forwarded headers are never read here: uvicorn rewrites
+    the client address from X-Forwarded-For only for FORWARDED_ALLOW_IPS.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in RATE_LIMIT_API_KEYS:
+        return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+def rate_limit(route: str, limit: Optional[RateLimit] = None):
+    """
+    Build a FastAPI dependency enforcing admission control for a write route.
+
+    Args:
+        route: Route name used to look up its limit and to scope client buckets
+        limit: Fallback limit when the route is not configured in RATE_LIMITS
+
+    Returns:
+        Dependency that raises 429 when the client exceeds its rate limit and
+        503 when too many write requests are already in flight
+    """
+    async def dependency(request: Request):
+        route_limit = route_limits.get(route, limit)
+        if route_limit is not None:
+            allowed, retry_after = await backend.acquire(f"{route}:{get_client_key(request)}", route_limit)
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Rate limit exceeded",
+                    headers=_retry_after(retry_after)
+                )
+
+        if not write_limiter.try_acquire():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry",
+                headers=_retry_after(WRITE_CONCURRENCY_RETRY_AFTER)
+            )
+        try:
+            yield
+        finally:
+            write_limiter.release()
+
+    return dependency
@@ -4,11 +4,15 @@ Simple script to run the FastAPI application
 """
 import uvicorn
 
+from config import FORWARDED_ALLOW_IPS
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS
     )
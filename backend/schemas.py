@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, create_model
 from datetime import datetime
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple, Type
 from timezone_utils import validate_timezone
 
 class EventCreate(BaseModel):
@@ -30,6 +31,50 @@ class EventWithTimezone(EventResponse):
     end_time_local: str
     timezone_display: str
 
+# Fields added to event responses when a `timezone=` is requested
+LOCAL_TIME_FIELDS = ('start_time_local', 'end_time_local')
+
+class LocalizedEventResponse(EventResponse):
+    """Event response with local times, set only when a timezone is requested."""
+    start_time_local: Optional[str] = None
+    end_time_local: Optional[str] = None
+
+class EventListItem(BaseModel):
+    """Event in `GET /events`; `fields=` limits which fields are present and local times need `timezone=`."""
+    id: Optional[int] = None
+    name: Optional[str] = None
+    location: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    max_capacity: Optional[int] = None
+    attendee_count: Optional[int] = None
+    timezone: Optional[str] = None
+    start_time_local: Optional[str] = None
+    end_time_local: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class AttendeeListItem(BaseModel):
+    """Attendee in `GET /events/{event_id}/attendees`; `fields=` limits which fields are present."""
+    id: Optional[int] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    event_id: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+class BatchEvent(LocalizedEventResponse):
+    """Event in a batch response; count and local times are only set when requested."""
+    attendee_count: Optional[int] = None
+
+class BatchEventResult(BaseModel):
+    """Lookup result for one requested event ID."""
+    id: int
+    found: bool
+    event: Optional[BatchEvent] = None
+
 class AttendeeCreate(BaseModel):
     name: str
     email: str
@@ -43,5 +88,36 @@ class AttendeeResponse(BaseModel):
     class Config:
         from_attributes = True
 
-class EventWithAttendees(EventResponse):
+class EventWithAttendees(LocalizedEventResponse):
     attendees: List[AttendeeResponse]
+
+def parse_fields(value: Optional[str], allowed: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated `fields=` query parameter.
+    
+    Args:
+        value: Raw parameter value, or None when not provided
+        allowed: Field names that may be selected, in output order
+    
+    Returns:
+        Selected fields in `allowed` order, or None to select everything
+    """
+    if value is None:
+        return None
+    
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if not requested:
+        raise ValueError("At least one field must be requested")
+    return tuple(field for field in allowed if field in requested)
+
+@lru_cache(maxsize=128)
+def project_model(model: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Create (and cache) a response model containing only `fields` of `model`."""
+    return create_model(
+        f"{model.__name__}Projection",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    )
@@ -0,0 +1,90 @@
+"""
+Per-worker record of events that have reached maximum capacity.
+Lets registrations for full events be refused without touching the database.
+"""
+import logging
+import select
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "event_sold_out"
+
+class SoldOutCache:
+    """Set of sold-out event IDs, seeded from the database and kept current by registrations and notifications."""
+
+    def __init__(self, enabled: bool = True):
+        # When disabled every registration goes through the database checks
+        self.enabled = enabled
+        self._event_ids: Set[int] = set()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def is_sold_out(self, event_id: int) -> bool:
+        return self.enabled and event_id in self._event_ids
+
+    def mark(self, event_id: int) -> None:
+        with self._lock:
+            self._event_ids.add(event_id)
+
+    def discard(self, event_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._event_ids.difference_update(event_ids)
+
+    def seed(self) -> int:
+        """Load every event that is currently full; returns the number found."""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT e.id FROM events e
+                WHERE e.max_capacity <= (
+                    SELECT COUNT(*) FROM attendees a WHERE a.event_id = e.id
+                )
+            """)
+            event_ids = {row['id'] for row in cursor.fetchall()}
+
+        with self._lock:
+            self._event_ids = event_ids
+        return len(event_ids)
+
+    def start_listener(self, poll_timeout: float = 5.0, retry_delay: float = 5.0) -> None:
+        """Follow sold-out notifications from other workers in a background thread."""
+        if self._listener is not None:
+            return
+        self._listener = threading.Thread(
+            target=self._listen,
+            args=(poll_timeout, retry_delay),
+            name="sold-out-listener",
+            daemon=True
+        )
+        self._listener.start()
+
+    def _listen(self, poll_timeout: float, retry_delay: float) -> None:
+        while True:
+            connection = None
+            try:
+                connection = db.get_connection()
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Notifications may have been missed while disconnected
+                self.seed()
+                while True:
+                    if select.select([connection], [], [], poll_timeout) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        self.mark(int(notify.payload))
+            except Exception as e:
+                logger.error(f"Sold-out listener failed, reconnecting: {e}")
+                time.sleep(retry_delay)
+            finally:
+                if connection:
+                    connection.close()
+
+# Global sold-out cache for this worker
+sold_out_events = SoldOutCache()
@@ -0,0 +1,71 @@
+"""
+Accept-Encoding negotiation and the size threshold of CompressionMiddleware.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+@pytest.mark.parametrize("header,expected", [
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;foo=1;q=0.5", "gzip"),
+    ("gzip; Q=0.8", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;foo=1;q=0", None),
+    ("gzip;q=oops", None),
+    ("*", "gzip"),
+    ("*;q=0.3, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding_gzip(gzip_only, header, expected):
+    assert choose_encoding(header) == expected
+
+def test_choose_encoding_prefers_brotli_when_installed():
+    pytest.importorskip("brotli")
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip;q=1, br;level=5;q=0.5") == "gzip"
+
+@pytest.fixture
+def client(gzip_only):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/json/{size}")
+    def json_body(size: int):
+        return {"data": "x" * size}
+
+    @app.get("/image")
+    def image():
+        return PlainTextResponse("x" * 1000, media_type="image/png")
+
+    return TestClient(app)
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get("/json/10", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"data": "x" * 10}
+
+def test_large_responses_are_compressed(client):
+    response = client.get("/json/1000", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    # httpx decodes the body transparently; the raw length is what went over the wire
+    assert int(response.headers["content-length"]) < 1000
+    assert response.json() == {"data": "x" * 1000}
+
+def test_clients_without_gzip_get_identity(client):
+    response = client.get("/json/1000", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+def test_incompressible_types_are_passed_through(client):
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,36 @@
+"""
+Validation of `fields=` projections in schemas and crud.
+"""
+import asyncio
+
+import pytest
+
+import crud
+from crud import EVENT_FIELDS
+from schemas import EventResponse, parse_fields, project_model
+
+def test_parse_fields_keeps_allowed_order():
+    assert parse_fields(" name, id ,,", EVENT_FIELDS) == ("id", "name")
+    assert parse_fields(None, EVENT_FIELDS) is None
+
+@pytest.mark.parametrize("value", ["", " , ", "id,password", "id;DROP TABLE events"])
+def test_parse_fields_rejects_empty_and_unknown(value):
+    with pytest.raises(ValueError):
+        parse_fields(value, EVENT_FIELDS)
+
+def test_project_model_contains_only_selected_fields():
+    model = project_model(EventResponse, ("id", "name"))
+    assert list(model.model_fields) == ["id", "name"]
+    assert project_model(EventResponse, ("id", "name")) is model
+
+@pytest.mark.parametrize("call", [
+    lambda: crud.get_events(fields=("id", "e.id; DROP TABLE events --")),
+    lambda: crud.get_attendees(1, fields=("id", "(SELECT password FROM users)")),
+])
+def test_crud_rejects_unknown_fields_before_querying(call, monkeypatch):
+    def no_database(*args, **kwargs):
+        raise AssertionError("database was queried")
+
+    monkeypatch.setattr(crud.db, "get_cursor", no_database)
+    with pytest.raises(ValueError, match="Unknown fields"):
+        asyncio.run(call())
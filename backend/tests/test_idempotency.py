@@ -0,0 +1,180 @@
+"""
+Idempotency-Key handling.
+
+The replay logic of IdempotencyStore.run is tested against an in-memory
+subclass. The claim/complete/prune statements themselves run against a
+scratch schema when TEST_DATABASE_URL is set:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost:5432/postgres pytest tests/test_idempotency.py
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+import psycopg2
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+import database
+from idempotency import REPLAY_HEADER, IdempotencyStore, StoredResponse
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = "idempotency_test"
+
+class Item(BaseModel):
+    id: int
+    name: str
+
+class MemoryStore(IdempotencyStore):
+    """IdempotencyStore keeping its rows in a dict instead of the database."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows: Dict[str, StoredResponse] = {}
+
+    def claim(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        if key in self.rows:
+            return self.rows[key]
+        self.rows[key] = StoredResponse(fingerprint, None, None)
+        return None
+
+    def complete(self, key: str, status_code: int, content) -> None:
+        self.rows[key] = StoredResponse(self.rows[key].fingerprint, status_code, content)
+
+    def release(self, key: str) -> None:
+        if self.rows[key].status_code is None:
+            del self.rows[key]
+
+class CountingHandler:
+    def __init__(self, result=None, error: Optional[Exception] = None):
+        self.calls = 0
+        self.result = result or {"id": 1, "name": "Launch"}
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def run(store: IdempotencyStore, handler, fingerprint: str = "body-1"):
+    return asyncio.run(store.run("POST:/events:key-1", fingerprint, handler, Item))
+
+def test_repeated_key_replays_first_response():
+    store, handler = MemoryStore(), CountingHandler()
+    assert run(store, handler) == {"id": 1, "name": "Launch"}
+
+    replay = run(store, handler)
+    assert handler.calls == 1
+    assert replay.status_code == 200
+    assert replay.body == b'{"id":1,"name":"Launch"}'
+    assert replay.headers[REPLAY_HEADER] == "true"
+
+def test_reused_key_with_different_body_is_rejected():
+    store, handler = MemoryStore(), CountingHandler()
+    run(store, handler)
+    with pytest.raises(HTTPException) as exc_info:
+        run(store, handler, fingerprint="body-2")
+    assert exc_info.value.status_code == 409
+    assert handler.calls == 1
+
+def test_client_errors_are_stored():
+    store = MemoryStore()
+    handler = CountingHandler(error=HTTPException(status_code=400, detail="Event is at maximum capacity"))
+    with pytest.raises(HTTPException):
+        run(store, handler)
+
+    replay = run(store, handler)
+    assert handler.calls == 1
+    assert replay.status_code == 400
+    assert replay.body == b'{"detail":"Event is at maximum capacity"}'
+
+@pytest.mark.parametrize("error", [HTTPException(status_code=503, detail="busy"), RuntimeError("connection lost")])
+def test_server_errors_are_not_stored(error):
+    store = MemoryStore()
+    with pytest.raises(type(error)):
+        run(store, CountingHandler(error=error))
+    assert store.rows == {}
+
+    handler = CountingHandler()
+    assert run(store, handler) == {"id": 1, "name": "Launch"}
+    assert handler.calls == 1
+
+def test_concurrent_duplicate_is_refused_while_first_runs():
+    store = MemoryStore()
+    calls = 0
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_handler():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"id": 1, "name": "Launch"}
+
+        first = asyncio.create_task(store.run("key", "body", slow_handler, Item))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await store.run("key", "body", slow_handler, Item)
+        release.set()
+        await first
+        return exc_info.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 409
+    assert error.headers == {"Retry-After": "1"}
+    assert calls == 1
+
+@pytest.fixture
+def db_store():
+    if not DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    connection = psycopg2.connect(DATABASE_URL)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+
+    original_params = database.db.connection_params
+    database.db.connection_params = {"dsn": DATABASE_URL, "options": f"-c search_path={SCHEMA}"}
+    try:
+        database.create_tables()
+        yield IdempotencyStore(ttl=3600, lock_timeout=3600)
+    finally:
+        database.db.connection_params = original_params
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        connection.close()
+
+def test_claim_then_complete(db_store):
+    assert db_store.claim("key", "body") is None
+    assert db_store.claim("key", "body") == StoredResponse("body", None, None)
+
+    db_store.complete("key", 200, {"id": 1})
+    assert db_store.claim("key", "other") == StoredResponse("body", 200, {"id": 1})
+
+def test_release_allows_a_new_claim(db_store):
+    db_store.claim("key", "body")
+    db_store.release("key")
+    assert db_store.claim("key", "body") is None
+
+def test_expired_and_abandoned_keys_are_taken_over(db_store):
+    db_store.ttl = 0
+    db_store.claim("expired", "body")
+    db_store.complete("expired", 200, {"id": 1})
+    assert db_store.claim("expired", "new-body") is None
+
+    db_store.ttl, db_store.lock_timeout = 3600, 0
+    db_store.claim("abandoned", "body")
+    assert db_store.claim("abandoned", "body") is None
+
+def test_prune_deletes_only_expired_keys(db_store):
+    db_store.claim("live", "body")
+    db_store.ttl = 0
+    db_store.claim("expired-1", "body")
+    db_store.claim("expired-2", "body")
+    assert db_store.prune() == 2
+    assert db_store.claim("live", "body") is not None
@@ -0,0 +1,246 @@
+"""
+Query-plan regression tests for the statements issued by crud.py.
+
+Synthetic data is loaded at several scales into a scratch schema of a local
+PostgreSQL database. Every crud function is then run with each of its
+statements captured through EXPLAIN (ANALYZE, BUFFERS), and the plans are
+checked for index access and for buffer/row budgets that must not grow with
+the size of the tables. Plans are written as JSON to PLAN_ARTIFACT_DIR.
+
+    PLAN_TEST_DATABASE_URL=postgresql://postgres@localhost:5432/postgres pytest tests/test_query_plans.py
+
+Environment:
+    PLAN_TEST_DATABASE_URL: Database to create the scratch schemas in (tests are skipped without it)
+    PLAN_TEST_SCALES: Comma-separated event counts to test (default "10000,100000")
+    PLAN_ARTIFACT_DIR: Directory for captured plans (default "plan_artifacts")
+"""
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+import archive
+import crud
+import database
+from schemas import AttendeeCreate
+from sold_out import sold_out_events
+
+DATABASE_URL = os.getenv("PLAN_TEST_DATABASE_URL")
+SCALES = [int(scale) for scale in os.getenv("PLAN_TEST_SCALES", "10000,100000").split(",")]
+ARTIFACT_DIR = Path(os.getenv("PLAN_ARTIFACT_DIR", "plan_artifacts"))
+ATTENDEES_PER_EVENT = 20
+EVENT_CAPACITY = 50
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="PLAN_TEST_DATABASE_URL is not set")
+
+class PlanCapturingCursor:
+    """Cursor that records the EXPLAIN (ANALYZE, BUFFERS) plan of each statement before running it."""
+
+    def __init__(self, cursor: RealDictCursor, plans: List[dict]):
+        self._cursor = cursor
+        self._plans = plans
+
+    def execute(self, query: str, params: Optional[dict] = None) -> None:
+        # ANALYZE really executes the statement, so undo its effects before the real run
+        self._cursor.execute("SAVEPOINT plan_capture")
+        self._cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+        plan = self._cursor.fetchone()["QUERY PLAN"][0]
+        self._cursor.execute("ROLLBACK TO SAVEPOINT plan_capture")
+        self._plans.append({"query": " ".join(query.split()), "plan": plan})
+        self._cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class PlanRecorder:
+    """Runs crud functions on one connection, capturing plans and rolling back afterwards."""
+
+    def __init__(self, connection, events: int):
+        self.connection = connection
+        self.events = events
+        self.plans: List[dict] = []
+
+    @contextmanager
+    def get_cursor(self, dict_cursor: bool = True) -> Iterator[PlanCapturingCursor]:
+        cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            yield PlanCapturingCursor(cursor, self.plans)
+        finally:
+            cursor.close()
+
+    def run(self, coroutine) -> List[dict]:
+        """Run a crud coroutine and return the plans of the statements it issued."""
+        self.plans = []
+        try:
+            asyncio.run(coroutine)
+        finally:
+            self.connection.rollback()
+        return self.plans
+
+def connect(schema: str):
+    return psycopg2.connect(DATABASE_URL, options=f"-c search_path={schema}")
+
+def reset_schema(schema: str, create: bool = True) -> None:
+    connection = psycopg2.connect(DATABASE_URL)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            if create:
+                cursor.execute(f"CREATE SCHEMA {schema}")
+        connection.commit()
+    finally:
+        connection.close()
+
+def load_synthetic_data(schema: str, events: int) -> None:
+    reset_schema(schema)
+
+    original_params = database.db.connection_params
+    database.db.connection_params = {"dsn": DATABASE_URL, "options": f"-c search_path={schema}"}
+    try:
+        database.create_tables()
+    finally:
+        database.db.connection_params = original_params
+
+    connection = connect(schema)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO events (name, location, start_time, end_time, max_capacity, timezone)
+                SELECT 'Event ' || g, 'Location ' || (g %% 100),
+                       timestamp '2020-01-01' + g * interval '1 hour',
+                       timestamp '2020-01-01' + g * interval '1 hour' + interval '2 hours',
+                       %(capacity)s, 'UTC'
+                FROM generate_series(1, %(events)s) g
+            """, {"events": events, "capacity": EVENT_CAPACITY})
+            cursor.execute("""
+                INSERT INTO attendees (name, email, event_id)
+                SELECT 'Attendee ' || g, 'user' || g || '@example.com', 1 + g %% %(events)s
+                FROM generate_series(1, %(attendees)s) g
+            """, {"events": events, "attendees": events * ATTENDEES_PER_EVENT})
+            cursor.execute("VACUUM ANALYZE events")
+            cursor.execute("VACUUM ANALYZE attendees")
+    finally:
+        connection.close()
+
+def plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def scanned_rows(plan: dict) -> int:
+    """Rows produced by every scan node, i.e. how much table data the statement touched."""
+    return sum(
+        int(node.get("Actual Rows", 0) * node.get("Actual Loops", 1))
+        for node in plan_nodes(plan["Plan"])
+        if "Relation Name" in node or node["Node Type"].startswith("Bitmap Index")
+    )
+
+def shared_buffers(plan: dict) -> int:
+    root = plan["Plan"]
+    return root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0)
+
+def assert_plan(captured: dict, max_buffers: int, max_rows: int, indexes: tuple = ()) -> None:
+    """Check that a statement avoids sequential scans, uses `indexes` and stays within its budgets."""
+    plan = captured["plan"]
+    nodes = list(plan_nodes(plan["Plan"]))
+    seq_scans = [node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"]
+    used_indexes = {node["Index Name"] for node in nodes if "Index Name" in node}
+
+    assert not seq_scans, f"Sequential scan on {seq_scans}: {captured['query']}"
+    for index in indexes:
+        assert index in used_indexes, f"{index} not used (used {sorted(used_indexes)}): {captured['query']}"
+    assert shared_buffers(plan) <= max_buffers, f"{shared_buffers(plan)} buffers > {max_buffers}: {captured['query']}"
+    assert scanned_rows(plan) <= max_rows, f"{scanned_rows(plan)} rows > {max_rows}: {captured['query']}"
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda scale: f"{scale}_events")
+def recorder(request):
+    events = request.param
+    schema = f"plan_test_{events}"
+    load_synthetic_data(schema, events)
+
+    connection = connect(schema)
+    original_get_cursor = database.db.get_cursor
+    plan_recorder = PlanRecorder(connection, events)
+    database.db.get_cursor = plan_recorder.get_cursor
+    sold_out_events.discard(range(events + 1))
+    try:
+        yield plan_recorder
+    finally:
+        database.db.get_cursor = original_get_cursor
+        connection.close()
+        reset_schema(schema, create=False)
+
+@pytest.fixture
+def save_plans(request, recorder):
+    """Write the plans captured by a test to the artifact directory."""
+    captured: Dict[str, List[dict]] = {}
+    yield captured
+    ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARTIFACT_DIR / f"{request.node.name.replace('[', '-').rstrip(']')}.json"
+    path.write_text(json.dumps(captured, indent=2, default=str))
+
+def test_get_events_first_page(recorder, save_plans):
+    plans = save_plans["get_events"] = recorder.run(crud.get_events(skip=0, limit=100))
+    assert len(plans) == 1
+    assert_plan(plans[0], max_buffers=1500, max_rows=100 * (ATTENDEES_PER_EVENT + 2),
+                indexes=("idx_events_start_time",))
+
+def test_get_events_projection_skips_attendees(recorder, save_plans):
+    plans = save_plans["get_events"] = recorder.run(crud.get_events(skip=0, limit=100, fields=("id", "name")))
+    assert_plan(plans[0], max_buffers=200, max_rows=200, indexes=("idx_events_start_time",))
+    assert "attendees" not in {node.get("Relation Name") for node in plan_nodes(plans[0]["plan"]["Plan"])}
+
+def test_get_event(recorder, save_plans):
+    plans = save_plans["get_event"] = recorder.run(crud.get_event(recorder.events // 2))
+    assert len(plans) == 1
+    assert_plan(plans[0], max_buffers=50, max_rows=ATTENDEES_PER_EVENT * 3, indexes=("events_pkey",))
+
+def test_get_events_by_ids(recorder, save_plans):
+    event_ids = list(range(1, recorder.events, recorder.events // 100))[:100]
+    plans = save_plans["get_events_by_ids"] = recorder.run(crud.get_events_by_ids(event_ids, with_counts=True))
+    assert_plan(plans[0], max_buffers=1500, max_rows=len(event_ids) * (ATTENDEES_PER_EVENT + 2),
+                indexes=("events_pkey",))
+
+def test_create_attendee(recorder, save_plans):
+    attendee = AttendeeCreate(name="Plan Test", email="plan-test@example.com")
+    plans = save_plans["create_attendee"] = recorder.run(crud.create_attendee(attendee, recorder.events // 2))
+    # get_event, duplicate check, capacity count, insert
+    assert len(plans) == 4
+    for captured in plans:
+        assert_plan(captured, max_buffers=100, max_rows=ATTENDEES_PER_EVENT * 3)
+
+def test_get_attendees(recorder, save_plans):
+    plans = save_plans["get_attendees"] = recorder.run(crud.get_attendees(recorder.events // 2, skip=0, limit=100))
+    assert len(plans) == 1
+    assert_plan(plans[0], max_buffers=50, max_rows=ATTENDEES_PER_EVENT * 3)
+
+def test_get_attendees_count(recorder, save_plans):
+    plans = save_plans["get_attendees_count"] = recorder.run(crud.get_attendees_count(recorder.events // 2))
+    assert_plan(plans[0], max_buffers=50, max_rows=ATTENDEES_PER_EVENT * 3)
+
+def test_archive_batch_and_archived_reads(recorder, save_plans):
+    # Synthetic events start hourly from 2020-01-01 and last two hours
+    cutoff = datetime(2020, 1, 1) + timedelta(hours=100)
+    
+    async def archive_then_read():
+        archive.archive_batch(cutoff, batch_size=100)
+        await crud.get_archived_event(50)
+        await crud.get_archived_attendees(50)
+    
+    plans = save_plans["archive"] = recorder.run(archive_then_read())
+    # lock_timeout, select batch, copy events, copy attendees, delete, then the two reads
+    assert len(plans) == 7
+    assert_plan(plans[1], max_buffers=500, max_rows=200, indexes=("idx_events_end_time",))
+    assert_plan(plans[2], max_buffers=500, max_rows=200, indexes=("events_pkey",))
+    assert_plan(plans[3], max_buffers=12000, max_rows=2 * 100 * (ATTENDEES_PER_EVENT + 2), indexes=("idx_attendees_event_id",))
+    assert_plan(plans[4], max_buffers=20000, max_rows=200, indexes=("events_pkey",))
+    for captured in plans[5:]:
+        assert_plan(captured, max_buffers=50, max_rows=ATTENDEES_PER_EVENT * 4)
@@ -0,0 +1,103 @@
+"""
+Token-bucket and admission-control behaviour of rate_limit.py.
+"""
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import ConcurrencyLimiter, InMemoryBackend, RateLimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake)
+    return fake
+
+def acquire(backend, key: str, limit: RateLimit):
+    return asyncio.run(backend.acquire(key, limit))
+
+def test_parse_limit():
+    assert RateLimit.parse("20/60") == RateLimit(capacity=20, period=60.0)
+    for value in ("20", "x/60", "0/60", "20/0", "-1/60"):
+        with pytest.raises(ValueError):
+            RateLimit.parse(value)
+
+def test_bucket_allows_capacity_then_rejects(clock):
+    backend = InMemoryBackend()
+    limit = RateLimit(capacity=3, period=60)
+    assert [acquire(backend, "client", limit)[0] for _ in range(4)] == [True, True, True, False]
+
+def test_retry_after_is_time_to_next_token(clock):
+    backend = InMemoryBackend()
+    limit = RateLimit(capacity=2, period=60)
+    acquire(backend, "client", limit)
+    acquire(backend, "client", limit)
+    allowed, retry_after = acquire(backend, "client", limit)
+    assert not allowed
+    assert retry_after == pytest.approx(30.0)
+
+def test_bucket_refills_over_time_up_to_capacity(clock):
+    backend = InMemoryBackend()
+    limit = RateLimit(capacity=2, period=60)
+    acquire(backend, "client", limit)
+    acquire(backend, "client", limit)
+
+    clock.now += 30
+    assert acquire(backend, "client", limit)[0]
+    assert not acquire(backend, "client", limit)[0]
+
+    # A long idle period refills the bucket to capacity, not beyond it
+    clock.now += 3600
+    assert [acquire(backend, "client", limit)[0] for _ in range(3)] == [True, True, False]
+
+def test_clients_have_separate_buckets(clock):
+    backend = InMemoryBackend()
+    limit = RateLimit(capacity=1, period=60)
+    assert acquire(backend, "a", limit)[0]
+    assert not acquire(backend, "a", limit)[0]
+    assert acquire(backend, "b", limit)[0]
+
+def test_least_recently_used_clients_are_evicted(clock):
+    backend = InMemoryBackend(max_clients=2)
+    limit = RateLimit(capacity=1, period=60)
+    acquire(backend, "a", limit)
+    acquire(backend, "b", limit)
+    acquire(backend, "c", limit)
+    # "a" was evicted, so it starts again with a full bucket
+    assert acquire(backend, "a", limit)[0]
+    assert not acquire(backend, "c", limit)[0]
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+def test_redis_failure_uses_fallback_during_cooldown(clock):
+    pytest.importorskip("redis.asyncio")
+    backend = rate_limit.RedisBackend("redis://127.0.0.1:1/0", fallback=InMemoryBackend(), cooldown=30)
+    calls = []
+
+    async def failing_script(keys, args):
+        calls.append(keys)
+        raise ConnectionError("unreachable")
+
+    backend._script = failing_script
+    limit = RateLimit(capacity=5, period=60)
+
+    assert acquire(backend, "client", limit)[0]
+    assert acquire(backend, "client", limit)[0]
+    assert len(calls) == 1
+
+    clock.now += 31
+    acquire(backend, "client", limit)
+    assert len(calls) == 2
@@ -0,0 +1,48 @@
+"""
+Batch timezone formatting must agree with a plain per-value astimezone,
+including at historical and DST transitions that fall on odd minutes.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytz
+
+from timezone_utils import SUPPORTED_TIMEZONES, format_datetime_with_timezone, format_datetimes_with_timezone
+
+def expected(dt: datetime, timezone_abbr: str) -> str:
+    tz = pytz.timezone(SUPPORTED_TIMEZONES[timezone_abbr])
+    return pytz.UTC.localize(dt).astimezone(tz).strftime(f"%Y-%m-%d %H:%M:%S {timezone_abbr}")
+
+def every(start: datetime, end: datetime, step: timedelta) -> list:
+    values = []
+    while start < end:
+        values.append(start)
+        start += step
+    return values
+
+# Each range contains at least one offset change in some supported timezone
+TRANSITION_RANGES = [
+    (datetime(1941, 9, 30), datetime(1941, 10, 2)),     # Asia/Kolkata +05:53:20 -> +06:30
+    (datetime(1945, 10, 14), datetime(1945, 10, 16)),   # Asia/Kolkata +06:30 -> +05:30 at 17:30 UTC
+    (datetime(1948, 3, 13), datetime(1948, 3, 16)),     # America/Los_Angeles -08:00 -> -07:00
+    (datetime(1949, 1, 1), datetime(1949, 1, 3)),       # America/Los_Angeles back to -08:00
+    (datetime(2024, 3, 9), datetime(2024, 4, 8)),       # spring changes in US, EU, Sydney
+    (datetime(2024, 10, 26), datetime(2024, 11, 4)),    # autumn changes in EU and US
+]
+
+@pytest.mark.parametrize("timezone_abbr", sorted(SUPPORTED_TIMEZONES))
+@pytest.mark.parametrize("start,end", TRANSITION_RANGES, ids=lambda dt: dt.date().isoformat())
+def test_matches_astimezone_across_transitions(timezone_abbr, start, end):
+    values = every(start, end, timedelta(minutes=7, seconds=13))
+    assert format_datetimes_with_timezone(values, timezone_abbr) == [expected(dt, timezone_abbr) for dt in values]
+
+def test_ist_1945_transition():
+    assert format_datetime_with_timezone(datetime(1945, 10, 14, 17, 36), "IST") == "1945-10-14 23:06:00 IST"
+
+def test_aware_datetimes_are_converted():
+    aware = datetime(2024, 7, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    assert format_datetimes_with_timezone([aware], "EST") == [expected(datetime(2024, 7, 1, 10, 0), "EST")]
+
+def test_unsupported_timezone():
+    with pytest.raises(ValueError):
+        format_datetimes_with_timezone([datetime(2024, 1, 1)], "XYZ")
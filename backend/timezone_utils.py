@@ -4,7 +4,7 @@ Handles timezone conversion and validation for events.
 """
 import pytz
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, List, Optional
 from pydantic import BaseModel
 
 class TimezoneInfo(BaseModel):
@@ -104,22 +104,38 @@ def format_datetime_with_timezone(dt: datetime, timezone_abbr: str) -> str:
     Format a datetime with timezone information.
     
     Args:
-        dt: Datetime object
+        dt: Datetime object (naive values are treated as UTC, as stored)
         timezone_abbr: Timezone abbreviation
     
     Returns:
         Formatted datetime string with timezone
     """
+    return format_datetimes_with_timezone([dt], timezone_abbr)[0]
+
+def format_datetimes_with_timezone(datetimes: Iterable[datetime], timezone_abbr: str) -> List[str]:
+    """
+    Format many datetimes in one timezone, resolving the zone only once.
+    
+    Args:
+        datetimes: Datetime objects (naive values are treated as UTC, as stored)
+        timezone_abbr: Timezone abbreviation
+    
+    Returns:
+        Formatted datetime strings with timezone, in input order
+    """
     if timezone_abbr not in SUPPORTED_TIMEZONES:
         raise ValueError(f"Unsupported timezone: {timezone_abbr}")
     
-    tz_name = SUPPORTED_TIMEZONES[timezone_abbr]
-    tz = pytz.timezone(tz_name)
-    
-    # Convert to the specified timezone
-    localized_dt = dt.astimezone(tz)
+    tz = pytz.timezone(SUPPORTED_TIMEZONES[timezone_abbr])
+    datetime_format = f"%Y-%m-%d %H:%M:%S {timezone_abbr}"
     
-    return localized_dt.strftime(f"%Y-%m-%d %H:%M:%S {timezone_abbr}")
+    results = []
+    for dt in datetimes:
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(pytz.UTC).replace(tzinfo=None)
+        # fromutc looks the offset up in the zone's transition list for each value
+        results.append(tz.fromutc(dt.replace(tzinfo=tz)).strftime(datetime_format))
+    return results
 
 def get_current_time_in_timezone(timezone_abbr: str) -> datetime:
     """
@@ -0,0 +1,226 @@
+"""
+Opt-in per-request tracing.
+Records a span tree for each request (connection acquire, every SQL statement,
+model construction, endpoint and response encoding), logs slow requests and
+queries, and keeps a sample of recent traces for the debug endpoint.
+"""
+import functools
+import inspect
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import (
+    SLOW_QUERY_MS,
+    SLOW_REQUEST_MS,
+    TRACE_BUFFER_SIZE,
+    TRACE_SAMPLE_RATE,
+    TRACING_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """Timed operation within a trace."""
+
+    def __init__(self, name: str, start: float, **attributes: Any):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.children: List['Span'] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"children": [child.to_dict(origin) for child in self.children]} if self.children else {}),
+        }
+
+class Trace:
+    """Span tree for a single request."""
+
+    def __init__(self, method: str, path: str):
+        self.root = Span("request", time.perf_counter(), method=method, path=path)
+        self.started_at = time.time()
+        self.endpoint_end: Optional[float] = None
+        self._stack: List[Span] = [self.root]
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        current = Span(name, time.perf_counter(), **attributes)
+        self._stack[-1].children.append(current)
+        self._stack.append(current)
+        try:
+            yield current
+        finally:
+            current.end = time.perf_counter()
+            self._stack.remove(current)
+
+    def add_span(self, name: str, start: float, end: float, **attributes: Any) -> Span:
+        """Record an already finished span under the innermost open span."""
+        finished = Span(name, start, **attributes)
+        finished.end = end
+        self._stack[-1].children.append(finished)
+        return finished
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"started_at": self.started_at, **self.root.to_dict(self.root.start)}
+
+    def format(self) -> str:
+        """Render the span tree as indented text for logs."""
+        lines = []
+
+        def render(span: Span, depth: int) -> None:
+            details = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+            lines.append(f"{'  ' * depth}{span.name} {span.duration_ms:.1f}ms {details}".rstrip())
+            for child in span.children:
+                render(child, depth + 1)
+
+        render(self.root, 0)
+        return "\n".join(lines)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+# Sampled and slow traces, newest last
+recent_traces: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+_recent_lock = threading.Lock()
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record a span in the current request's trace; does nothing outside a traced request."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as span:
+        yield span
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace so the same statement always produces the same text."""
+    return re.sub(r"\s+", " ", query).strip()
+
+class TracedCursor:
+    """Cursor wrapper that times each statement, records its row count and logs slow queries."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query: str, params: Any = None) -> None:
+        statement = normalize_sql(query)
+        start = time.perf_counter()
+        with trace_span("sql", statement=statement) as span:
+            self._cursor.execute(query, params)
+            if span is not None:
+                span.attributes["rows"] = self._cursor.rowcount
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= SLOW_QUERY_MS:
+            logger.warning(f"Slow query ({duration_ms:.1f}ms, {self._cursor.rowcount} rows): {statement}")
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+def trace_cursor(cursor):
+    """Wrap a database cursor for tracing when tracing is enabled."""
+    return TracedCursor(cursor) if TRACING_ENABLED else cursor
+
+def _record(trace: Trace) -> None:
+    duration_ms = trace.root.duration_ms
+    slow = duration_ms >= SLOW_REQUEST_MS
+    if slow:
+        logger.warning(f"Slow request ({duration_ms:.1f}ms):\n{trace.format()}")
+    if slow or random.random() < TRACE_SAMPLE_RATE:
+        with _recent_lock:
+            recent_traces.append(trace)
+
+def get_recent_traces(limit: int = 50) -> List[Dict[str, Any]]:
+    """Most recent sampled or slow traces, newest first."""
+    with _recent_lock:
+        traces = list(recent_traces)[-limit:]
+    return [trace.to_dict() for trace in reversed(traces)]
+
+class TracingMiddleware:
+    """ASGI middleware starting a trace for every HTTP request."""
+
+    def __init__(self, app: ASGIApp, exclude_paths: tuple = ("/debug/traces",)):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_traced(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.root.attributes["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_trace.reset(token)
+            _record(trace)
+
+def _trace_endpoint(endpoint: Callable) -> Callable:
+    """Wrap an endpoint so its execution is a span and its end time is known."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def traced_endpoint(*args, **kwargs):
+            with trace_span("endpoint"):
+                result = await endpoint(*args, **kwargs)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_end = time.perf_counter()
+            return result
+    else:
+        @functools.wraps(endpoint)
+        def traced_endpoint(*args, **kwargs):
+            with trace_span("endpoint"):
+                result = endpoint(*args, **kwargs)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_end = time.perf_counter()
+            return result
+    return traced_endpoint
+
+class TracedRoute(APIRoute):
+    """Route class recording endpoint time and response encoding (validation and serialization) as spans."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        super().__init__(path, _trace_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            response = await handler(request)
+            trace = _current_trace.get()
+            if trace is not None and trace.endpoint_end is not None:
+                trace.add_span("response_encoding", trace.endpoint_end, time.perf_counter())
+            return response
+
+        return traced_handler